@@ -201,3 +201,8 @@ def get_parameter(key_type=KeyType.PRODUCT, key_size=256) -> EncryptionParameter
     if key_size not in possible_key_sizes:
         raise ValueError("Invalid key_size: %d" % key_size)
     return _KEY_TYPES_TO_RAW[key_type][key_size]
+
+
+# Imported last as it builds on the classes above
+# (ntruencrypt.shared isn't imported here as it needs Python 3.8+)
+from ntruencrypt.pipeline import ReencryptError, ReencryptProgress, reencrypt_stream  # noqa: E402
@@ -0,0 +1,143 @@
+import itertools
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, List
+
+from ntruencrypt import PrivateKey, PublicKey
+
+
+class ReencryptError(ValueError):
+    """Raised by :func:`reencrypt_stream` when a record can't be re-encrypted
+
+    `index` is the absolute position of the failing record in the source (the same scale as `resume_from`)
+    """
+
+    def __init__(self, index, message):
+        super().__init__(index, message)
+        self.index = index
+        self.message = message
+
+    def __str__(self):
+        return "Cannot re-encrypt record %d: %s" % (self.index, self.message)
+
+
+def _reencrypt_batch(keys, first_index, batch: List[bytes]):
+    # The keys travel with every batch: they are small and this doesn't need a pool initializer (Python 3.7+)
+    private_binary, private_params, public_binary, public_params = keys
+    private_key = PrivateKey(private_binary, params=private_params)
+    public_key = PublicKey(public_binary, params=public_params)
+
+    # On failure the records re-encrypted before the bad one are still returned, with the error
+    result = []
+    for i, data in enumerate(batch):
+        try:
+            result.append(public_key.encrypt(private_key.decrypt(data)))
+        except ValueError as e:
+            return result, ReencryptError(first_index + i, str(e))
+    return result, None
+
+
+class ReencryptProgress:
+    """Progress report of a :func:`reencrypt_stream` run
+
+    `records` counts every record of the source already re-encrypted and consumed, including the ones
+    skipped with `resume_from`, so it can be stored as a checkpoint and passed back as `resume_from`.
+    """
+
+    def __init__(self, records, processed, elapsed):
+        self._records = records
+        self._processed = processed
+        self._elapsed = elapsed
+
+    @property
+    def records(self):
+        return self._records
+
+    @property
+    def elapsed(self):
+        return self._elapsed
+
+    @property
+    def records_per_second(self):
+        return self._processed / self._elapsed if self._elapsed > 0 else 0.0
+
+
+def reencrypt_stream(source: Iterable[bytes], old_private_key: PrivateKey, new_public_key: PublicKey,
+                     workers=None, batch_size=256, max_pending=None, resume_from=0,
+                     progress: Callable[[ReencryptProgress], None] = None) -> Iterator[bytes]:
+    """Decrypts every ciphertext of `source` with `old_private_key` and encrypts it again with `new_public_key`
+
+    The source is read lazily in batches that are processed by a pool of worker processes, at most
+    `max_pending` batches are in flight at the same time so a slow consumer stops the source from being read.
+    Re-encrypted records are yielded in the same order as the source.
+
+    After every batch has been consumed `progress` is called with a :class:`ReencryptProgress`,
+    its `records` can be saved and passed back as `resume_from` to restart an interrupted rotation.
+
+    If a record can't be re-encrypted every record before it is yielded, `progress` is called with
+    `records` equal to the index of the bad record and then a :class:`ReencryptError` is raised.
+    Resuming from that checkpoint would fail on the same record again: handle that record separately
+    and resume from `index + 1`.
+
+    :param source: the ciphertexts to re-encrypt
+    :param old_private_key: the key that decrypts the source ciphertexts
+    :param new_public_key: the key used to encrypt the records again
+    :param workers: the number of worker processes (default `None`, one per CPU)
+    :param batch_size: the number of records sent to a worker at once (default `256`)
+    :param max_pending: the maximum number of batches in flight (default `None`, twice the workers)
+    :param resume_from: the number of source records to skip (default `0`)
+    :param progress: a callable receiving the progress after each batch (default `None`)
+    :returns: an iterator over the re-encrypted records
+    """
+    if batch_size < 1:
+        raise ValueError("Invalid batch_size: %d" % batch_size)
+    if resume_from < 0:
+        raise ValueError("Invalid resume_from: %d" % resume_from)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 1:
+        raise ValueError("Invalid workers: %d" % workers)
+    if max_pending is None:
+        max_pending = 2 * workers
+    if max_pending < 1:
+        raise ValueError("Invalid max_pending: %d" % max_pending)
+
+    keys = (bytes(old_private_key.as_binary), old_private_key.params,
+            bytes(new_public_key.as_binary), new_public_key.params)
+    # Not a generator itself, so that invalid arguments are reported when called and not at the first next()
+    return _reencrypt_stream(source, keys, workers, batch_size, max_pending, resume_from, progress)
+
+
+def _reencrypt_stream(source, keys, workers, batch_size, max_pending, resume_from, progress) -> Iterator[bytes]:
+    executor = ProcessPoolExecutor(max_workers=workers)
+
+    source = itertools.islice(source, resume_from, None)
+    batches = iter(lambda: list(itertools.islice(source, batch_size)), [])
+    pending = deque()
+    records = submitted = resume_from
+    processed = 0
+    start = time.monotonic()
+    try:
+        for batch in itertools.chain(batches, [None]):
+            if batch is not None:
+                pending.append(executor.submit(_reencrypt_batch, keys, submitted, batch))
+                submitted += len(batch)
+                if len(pending) < max_pending:
+                    continue
+
+            # Source exhausted or pool full: hand out the oldest batches
+            while pending and (batch is None or len(pending) >= max_pending):
+                result, error = pending.popleft().result()
+                yield from result
+                records += len(result)
+                processed += len(result)
+                if progress is not None:
+                    progress(ReencryptProgress(records, processed, time.monotonic() - start))
+                if error is not None:
+                    raise error
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown()
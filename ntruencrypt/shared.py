@@ -0,0 +1,189 @@
+import os
+import struct
+from ctypes import c_char
+from multiprocessing import resource_tracker, shared_memory
+from typing import Iterable, Iterator, List
+
+from ntruencrypt import _ntru, PrivateKey
+
+# Segment layout:
+#  header:  magic, number of keys
+#  index:   one (offset, length, parameter) entry per key
+#  data:    the packed private keys, one after the other
+_HEADER = struct.Struct('<4sI')
+_ENTRY = struct.Struct('<IIH')
+_MAGIC = b'NTRK'
+
+
+def _open_segment(name):
+    try:
+        # Python 3.13+: attaching processes must not unlink the segment on exit
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name == 'posix':
+            # Older versions register the segment with the resource tracker of this process too,
+            # that would unlink it as soon as this process exits
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class _Segment:
+    """Keeps a shared memory segment mapped while its set or any of its keys are using it"""
+
+    def __init__(self, shm: shared_memory.SharedMemory):
+        self.shm = shm
+        self._users = 1  # The SharedKeySet itself
+
+    def acquire(self):
+        self._users += 1
+
+    def release(self):
+        self._users -= 1
+        if self._users == 0:
+            self.shm.close()
+
+
+class _SharedPrivateKey(PrivateKey):
+    """A PrivateKey whose binary lives in a shared memory segment
+
+    Decryption uses the shared buffer directly, while `as_binary` returns a copy so that the shared
+    key can't be modified (and it compares equal to the binary of a normal key).
+    The key keeps the segment mapped for as long as it is alive.
+    """
+
+    def __init__(self, handle, params, segment: _Segment):
+        super().__init__(handle, params=params)
+        segment.acquire()
+        self._segment = segment
+
+    def __del__(self):
+        # The view on the segment must be gone before the segment can be unmapped
+        self._handle = None
+        self._segment.release()
+
+    @property
+    def as_binary(self):
+        return bytes(self._handle)
+
+
+class SharedKeySet:
+    """A set of private keys stored in shared memory
+
+    The keys are published once with :func:`publish` and every other process can :func:`attach` to the
+    same segment by its `name`. The PrivateKey objects exposed by this class don't own a copy of the key,
+    they decrypt using the shared segment directly, so the memory used grows with the number of keys
+    and not with the number of processes using them.
+    Attaching only reads the small index at the start of the segment, the keys themselves aren't parsed again.
+    Note that `as_binary` of a shared key returns a new copy of the key at every call.
+
+    A SharedKeySet can be pickled, the receiving process attaches to the same segment by name.
+    Only the publishing process should call :func:`unlink`, once every worker is done with the keys.
+    This module needs Python 3.8+ (`multiprocessing.shared_memory`).
+    :example:`key_set = SharedKeySet.publish([prv_key1, prv_key2])`
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner=False):
+        self._shm = shm
+        self._owner = owner
+        self._segment = _Segment(shm)  # type: _Segment
+        self._keys = self._load_keys()  # type: List[PrivateKey]
+
+    def _load_keys(self) -> List[PrivateKey]:
+        buf = self._shm.buf
+        magic, count = _HEADER.unpack_from(buf, 0)
+        if magic != _MAGIC:
+            raise ValueError("Shared memory segment '%s' doesn't contain a key set" % self._shm.name)
+
+        keys = []
+        for i in range(count):
+            offset, length, param = _ENTRY.unpack_from(buf, _HEADER.size + i * _ENTRY.size)
+            handle = (c_char * length).from_buffer(buf, offset)
+            keys.append(_SharedPrivateKey(handle, _ntru.EncryptParamSetId(param), self._segment))
+        return keys
+
+    @classmethod
+    def publish(cls, keys: Iterable[PrivateKey], name=None) -> 'SharedKeySet':
+        """Copies the given private keys into a new shared memory segment
+
+        :param keys: the private keys to publish, their order is kept
+        :param name: the name of the segment to create (default `None`, a random name is chosen)
+        :returns: the SharedKeySet owning the new segment
+        """
+        keys = list(keys)
+        data_offset = _HEADER.size + len(keys) * _ENTRY.size
+        size = data_offset + sum(len(key.as_binary) for key in keys)
+
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        try:
+            _HEADER.pack_into(shm.buf, 0, _MAGIC, len(keys))
+            offset = data_offset
+            for i, key in enumerate(keys):
+                binary = bytes(key.as_binary)
+                _ENTRY.pack_into(shm.buf, _HEADER.size + i * _ENTRY.size, offset, len(binary), key.params.value)
+                shm.buf[offset:offset + len(binary)] = binary
+                offset += len(binary)
+            return cls(shm, owner=True)
+        except BaseException:
+            shm.close()
+            shm.unlink()
+            raise
+
+    @classmethod
+    def attach(cls, name) -> 'SharedKeySet':
+        """Attaches to a key set already published by another process
+
+        :param name: the name of the shared memory segment
+        :returns: a SharedKeySet viewing the published keys
+        """
+        shm = _open_segment(name)
+        try:
+            return cls(shm)
+        except BaseException:
+            shm.close()
+            raise
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def close(self):
+        """Detaches this process from the segment
+
+        The keys already taken from this set keep working, the segment is unmapped once the last of them
+        is collected.
+        """
+        if self._segment is None:
+            return
+        self._keys = []
+        segment, self._segment = self._segment, None
+        segment.release()
+
+    def unlink(self):
+        """Destroys the shared memory segment, only the publishing process should call this"""
+        if os.name == 'posix':
+            # A process sharing our resource tracker may have unregistered the segment while attaching
+            resource_tracker.register(self._shm._name, 'shared_memory')
+        self._shm.unlink()
+
+    def __enter__(self) -> 'SharedKeySet':
+        return self
+
+    def __exit__(self, *args):
+        try:
+            self.close()
+        finally:
+            if self._owner:
+                self.unlink()
+
+    def __reduce__(self):
+        return SharedKeySet.attach, (self.name,)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __getitem__(self, index) -> PrivateKey:
+        return self._keys[index]
+
+    def __iter__(self) -> Iterator[PrivateKey]:
+        return iter(self._keys)
@@ -1,8 +1,32 @@
+import ctypes
+import multiprocessing
+import os
+import subprocess
+import sys
 import unittest
 import ntruencrypt
 
 EXAMPLE_DATA = b"Nel mezzo del cammin di nostra vita mi ritrovai per una selva oscura, che' la diritta via era smarita"
 
+# Attaches to a key set from a separately started process, then waits for its resource tracker
+# to do the cleanup it would do at exit (the tracker is a separate process, it would run after the check)
+ATTACH_IN_SUBPROCESS = """
+import os, sys
+from multiprocessing import resource_tracker
+from ntruencrypt.shared import SharedKeySet
+
+SharedKeySet.attach(sys.argv[1]).close()
+tracker = resource_tracker._resource_tracker
+if tracker._pid is not None:
+    os.close(tracker._fd)
+    os.waitpid(tracker._pid, 0)
+"""
+
+
+def decrypt_with_shared_key(key_set, index, data):
+    # Runs in a child process, key_set is attached again by name when unpickled
+    return key_set[index].decrypt(data)
+
 
 class NtruTest(unittest.TestCase):
     def test_simple_usage(self):
@@ -78,6 +102,127 @@ class NtruTest(unittest.TestCase):
         org_data = prv_key.decrypt(enc_data)
         self.assertEqual(org_data, EXAMPLE_DATA)
 
+    @unittest.skipIf(sys.version_info < (3, 8), "multiprocessing.shared_memory needs Python 3.8+")
+    def test_shared_key_set(self):
+        from ntruencrypt.shared import SharedKeySet
+
+        key_pairs = [ntruencrypt.create_keys(), ntruencrypt.create_keys(key_type=ntruencrypt.KeyType.SPEED)]
+
+        with SharedKeySet.publish(kp.private_key for kp in key_pairs) as key_set:
+            attached = SharedKeySet.attach(key_set.name)
+            self.addCleanup(attached.close)
+            self.assertEqual(len(attached), len(key_pairs))
+
+            segment = attached._shm.buf
+            segment_start = ctypes.addressof(ctypes.c_char.from_buffer(segment))
+            for (pub_key, prv_key), shared_key in zip(key_pairs, attached):
+                self.assertEqual(shared_key.as_binary, prv_key.as_binary)
+                self.assertEqual(shared_key.params, prv_key.params)
+
+                # Zero-copy: the key is used straight from the segment
+                key_start = ctypes.addressof(shared_key._handle)
+                self.assertGreaterEqual(key_start, segment_start)
+                self.assertLessEqual(key_start + len(prv_key.as_binary), segment_start + len(segment))
+
+                message = EXAMPLE_DATA[:pub_key.max_message_len]
+                self.assertEqual(shared_key.decrypt(pub_key.encrypt(message)), message)
+
+            # The set is pickled by name and attached again in the worker
+            pub_key = key_pairs[1].public_key
+            message = EXAMPLE_DATA[:pub_key.max_message_len]
+            with multiprocessing.Pool(1) as pool:
+                decrypted = pool.apply(decrypt_with_shared_key, (key_set, 1, pub_key.encrypt(message)))
+            self.assertEqual(decrypted, message)
+
+            # A separately started process attaching and exiting must not destroy the segment
+            package_root = os.path.dirname(os.path.dirname(os.path.abspath(ntruencrypt.__file__)))
+            python_path = os.pathsep.join(filter(None, [package_root, os.environ.get('PYTHONPATH')]))
+            env = dict(os.environ, PYTHONPATH=python_path)
+            subprocess.check_call([sys.executable, '-c', ATTACH_IN_SUBPROCESS, key_set.name], env=env)
+            SharedKeySet.attach(key_set.name).close()
+
+            # Closing while a key is still referenced must not break the key
+            attached.close()
+            self.assertEqual(shared_key.decrypt(pub_key.encrypt(message)), message)
+
+    def test_reencrypt_stream(self):
+        old_pub_key, old_prv_key = ntruencrypt.create_keys()
+        new_pub_key, new_prv_key = ntruencrypt.create_keys()
+        messages = [b'Record %d' % i for i in range(50)]
+        encrypted = [old_pub_key.encrypt(message) for message in messages]
+
+        reports = []
+        reencrypted = list(ntruencrypt.reencrypt_stream(
+            iter(encrypted), old_prv_key, new_pub_key, workers=2, batch_size=8, resume_from=10,
+            progress=reports.append
+        ))
+
+        # Order is preserved and the first resume_from records are skipped
+        self.assertEqual([new_prv_key.decrypt(data) for data in reencrypted], messages[10:])
+        self.assertEqual(reports[-1].records, len(messages))
+        self.assertGreater(reports[-1].records_per_second, 0)
+
+        # Backpressure: the first result can't pull more than max_pending batches from the source
+        read = []
+
+        def counting_source():
+            for data in encrypted:
+                read.append(data)
+                yield data
+
+        stream = ntruencrypt.reencrypt_stream(counting_source(), old_prv_key, new_pub_key,
+                                              workers=2, batch_size=5, max_pending=2, resume_from=7)
+        next(stream)
+        self.assertLessEqual(len(read), 7 + 2 * 5)
+        stream.close()
+
+        # Resume: restarting from an intermediate checkpoint continues where the first run stopped
+        reports = []
+        stream = ntruencrypt.reencrypt_stream(iter(encrypted), old_prv_key, new_pub_key,
+                                              workers=2, batch_size=8, progress=reports.append)
+        first_run = []
+        while not reports:
+            first_run.append(next(stream))
+        stream.close()
+        checkpoint = reports[0].records
+        self.assertEqual(checkpoint, 8)
+
+        second_run = list(ntruencrypt.reencrypt_stream(iter(encrypted), old_prv_key, new_pub_key,
+                                                       workers=2, batch_size=8, resume_from=checkpoint))
+        decrypted = [new_prv_key.decrypt(data) for data in first_run[:checkpoint] + second_run]
+        self.assertEqual(decrypted, messages)
+
+    def test_reencrypt_stream_bad_record(self):
+        old_pub_key, old_prv_key = ntruencrypt.create_keys()
+        new_pub_key, new_prv_key = ntruencrypt.create_keys()
+        messages = [b'Record %d' % i for i in range(20)]
+        encrypted = [old_pub_key.encrypt(message) for message in messages]
+        encrypted[13] = new_pub_key.encrypt(b'Encrypted with the wrong key')
+
+        reports = []
+        first_run = []
+        with self.assertRaises(ntruencrypt.ReencryptError) as context:
+            for data in ntruencrypt.reencrypt_stream(iter(encrypted), old_prv_key, new_pub_key,
+                                                     workers=2, batch_size=4, progress=reports.append):
+                first_run.append(data)
+        index = context.exception.index
+        self.assertEqual(index, 13)
+        self.assertEqual(len(first_run), index)
+        self.assertEqual(reports[-1].records, index)
+
+        # Skipping only the bad record, every good record is re-encrypted exactly once
+        second_run = list(ntruencrypt.reencrypt_stream(iter(encrypted), old_prv_key, new_pub_key,
+                                                       workers=2, batch_size=4, resume_from=index + 1))
+        decrypted = [new_prv_key.decrypt(data) for data in first_run + second_run]
+        self.assertEqual(decrypted, messages[:index] + messages[index + 1:])
+
+    def test_reencrypt_stream_invalid_arguments(self):
+        pub_key, prv_key = ntruencrypt.create_keys()
+        # Raised when called, not when the first record is requested
+        self.assertRaises(ValueError, ntruencrypt.reencrypt_stream, iter([]), prv_key, pub_key, batch_size=0)
+        self.assertRaises(ValueError, ntruencrypt.reencrypt_stream, iter([]), prv_key, pub_key, resume_from=-1)
+        self.assertRaises(ValueError, ntruencrypt.reencrypt_stream, iter([]), prv_key, pub_key, max_pending=0)
+
     def test_invalid_keysize(self):
         # key_size not possible
         self.assertRaises(ValueError, ntruencrypt.get_parameter, key_size=123)